@@ -1,18 +1,65 @@
 from tools import tools, query_database, search_wikipedia
 
 from typing import List, Dict, Optional, Any
+from dataclasses import dataclass
 from openai import OpenAI, AzureOpenAI
 import json
 
 import os
 
+@dataclass
+class TokenBudget:
+    """Token limits that end the tool-calling loop early (None means unlimited)"""
+    max_tokens_per_turn: Optional[int] = None
+    max_tokens_per_session: Optional[int] = None
+
+def empty_usage() -> Dict[str, int]:
+    """Return a zeroed token usage record"""
+    return {
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "total_tokens": 0,
+        "llm_calls": 0
+    }
+
+def add_usage(totals: Dict[str, int], usage: Any) -> Dict[str, int]:
+    """
+    Add the usage of one completion (or another usage record) to a running total.
+
+    Args:
+        totals: The usage record to update in place
+        usage: A `completion.usage` object from OpenAI's API, or a usage dict
+
+    Returns:
+        Dict[str, int]: The updated totals
+    """
+    if usage is None:
+        return totals
+
+    if isinstance(usage, dict):
+        for key in totals:
+            totals[key] += usage.get(key, 0)
+        return totals
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    totals["prompt_tokens"] += usage.prompt_tokens or 0
+    totals["completion_tokens"] += usage.completion_tokens or 0
+    totals["cached_tokens"] += (getattr(details, "cached_tokens", None) or 0)
+    totals["total_tokens"] += usage.total_tokens or 0
+    totals["llm_calls"] += 1
+    return totals
+
 class Agent:
-    def __init__(self, system_prompt: Optional[str] = None):
+    def __init__(self,
+                 system_prompt: Optional[str] = None,
+                 token_budget: Optional[TokenBudget] = None):
         """
         Initialize an AI Agent with optional system prompt.
 
         Args:
             system_prompt: Initial instructions for the AI
+            token_budget: Optional per-turn and per-session token limits
         """
         # Initialize OpenAI client - expects OPENAI_API_KEY in environment
         # self.client = OpenAI()
@@ -25,6 +72,11 @@ class Agent:
         # Initialize conversation history
         self.messages = []
 
+        # Token usage of the current turn and of the whole session
+        self.token_budget = token_budget or TokenBudget()
+        self.turn_usage = empty_usage()
+        self.session_usage = empty_usage()
+
         # Set up system prompt if provided, otherwise use default
         default_prompt = """You are a helpful AI assistant with access to a database
         and Wikipedia. Follow these rules:
@@ -75,6 +127,36 @@ class Agent:
                 "error": f"Tool execution failed: {str(e)}"
             })
 
+    def start_turn(self):
+        """Reset the per-turn token usage before processing a new query"""
+        self.turn_usage = empty_usage()
+
+    def record_usage(self, usage: Any):
+        """
+        Record token usage of an LLM call against the current turn and session.
+
+        Args:
+            usage: A `completion.usage` object from OpenAI's API, or a usage dict
+        """
+        add_usage(self.turn_usage, usage)
+        add_usage(self.session_usage, usage)
+
+    def budget_exceeded(self) -> Optional[str]:
+        """
+        Check the recorded usage against the configured token budget.
+
+        Returns:
+            Optional[str]: Which budget was exceeded, or None if within budget
+        """
+        max_turn = self.token_budget.max_tokens_per_turn
+        max_session = self.token_budget.max_tokens_per_session
+
+        if max_turn is not None and self.turn_usage["total_tokens"] >= max_turn:
+            return f"per-turn token budget ({max_turn})"
+        if max_session is not None and self.session_usage["total_tokens"] >= max_session:
+            return f"per-session token budget ({max_session})"
+        return None
+
     def process_query(self, user_input: str) -> str:
         """
         Process a user query through the AI agent.
@@ -85,6 +167,8 @@ class Agent:
         Returns:
             str: The agent's response
         """
+        self.start_turn()
+
         # Add user input to conversation history
         self.messages.append({
             "role": "user",
@@ -94,8 +178,16 @@ class Agent:
         try:
             max_iterations = 5
             current_iteration = 0
+            response_message = None
+            stop_reason = f"maximum number of tool calls ({max_iterations})"
 
             while current_iteration < max_iterations:  # Limit to 5 iterations
+                # Stop before sending another request if we are out of budget
+                exceeded_budget = self.budget_exceeded()
+                if exceeded_budget:
+                    stop_reason = exceeded_budget
+                    break
+
                 current_iteration += 1
                 completion = self.client.chat.completions.create(
                     # model="gpt-4o",
@@ -104,6 +196,7 @@ class Agent:
                     tools=tools,  # Global tools list from Step 1
                     tool_choice="auto"  # Let the model decide when to use tools
                 )
+                self.record_usage(completion.usage)
 
                 response_message = completion.choices[0].message
 
@@ -137,13 +230,14 @@ class Agent:
                     })
                     print("Messages:", self.messages)
 
-            # If we've reached max iterations, return a message indicating this
-            max_iterations_message = {
+            # If we've run out of iterations or budget, return a partial answer
+            partial_answer = (response_message.content if response_message else None) or "no answer yet."
+            stop_message = {
                 "role": "assistant",
-                "content": "I've reached the maximum number of tool calls (5) without finding a complete answer. Here's what I know so far: " + response_message.content
+                "content": f"I've reached the {stop_reason} without finding a complete answer. Here's what I know so far: " + partial_answer
             }
-            self.messages.append(max_iterations_message)
-            return max_iterations_message["content"]
+            self.messages.append(stop_message)
+            return stop_message["content"]
 
         except Exception as e:
             error_message = f"Error processing query: {str(e)}"
@@ -1,4 +1,5 @@
 from memory_agent import MemoryAgent, MemoryConfig  # assuming we saved our code in your_agent.py
+from agent import TokenBudget
 import os
 from dotenv import load_dotenv
 
@@ -9,6 +10,10 @@ agent = MemoryAgent(
     memory_config=MemoryConfig(
         max_messages=10,  # summarize after 10 messages
         db_connection=os.getenv("DB_CONNECTION")
+    ),
+    token_budget=TokenBudget(
+        max_tokens_per_turn=50000,  # stop a runaway tool loop within one question
+        max_tokens_per_session=500000
     )
 )
 
@@ -16,6 +21,8 @@ agent = MemoryAgent(
 def chat_with_agent(question: str):
     print(f"\nUser: {question}")
     print(f"Assistant: {agent.process_query(question)}")
+    print(f"Token usage (turn): {agent.turn_usage}")
+    print(f"Token usage (session): {agent.session_usage}")
 
 if __name__ == "__main__":
     chat_with_agent("How many employees do we have in our database?")
@@ -1,10 +1,12 @@
 from datetime import datetime
+import hashlib
+import json
 import uuid
 from typing import List, Dict, Optional, Any
 from dataclasses import dataclass
 import psycopg2
 from psycopg2.extras import Json, UUID_adapter
-from agent import Agent
+from agent import Agent, TokenBudget, empty_usage, add_usage
 
 from openai import OpenAI, AzureOpenAI
 
@@ -18,11 +20,75 @@ class MemoryConfig:
     max_messages: int = 20  # When to summarize
     summary_length: int = 2000  # Max summary length in words
     db_connection: str = DB_CONNECTION
+    tool_preview_length: int = 200  # Max characters of a tool result kept inline
+
+def hash_tool_result(result: str) -> str:
+    """Content address of a full tool result"""
+    return hashlib.sha256(result.encode("utf-8")).hexdigest()
+
+def digest_tool_call(tool: str, arguments: str, result: str, preview_length: int) -> Dict[str, Any]:
+    """
+    Build a compact digest of a tool call to store inline with the conversation.
+
+    Args:
+        tool: Name of the tool that was called
+        arguments: JSON-encoded arguments the LLM passed to the tool
+        result: Full JSON-formatted result of the tool execution
+        preview_length: Max characters of the result to keep as a preview
+
+    Returns:
+        Dict[str, Any]: Query, row count, columns, preview and hash of the full result
+    """
+    digest = {
+        'tool': tool,
+        'result_hash': hash_tool_result(result)
+    }
+
+    try:
+        digest['query'] = json.loads(arguments)["query"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        digest['arguments'] = arguments
+
+    try:
+        parsed = json.loads(result)
+    except json.JSONDecodeError:
+        parsed = None
+
+    if isinstance(parsed, dict):
+        if "error" in parsed:
+            digest['error'] = parsed["error"]
+        if "row_count" in parsed:
+            digest['row_count'] = parsed["row_count"]
+        if "columns" in parsed:
+            digest['columns'] = parsed["columns"]
+        preview = parsed.get("data") or parsed.get("summary") or parsed.get("message") or ""
+    else:
+        preview = result
+
+    preview = str(preview)
+    if len(preview) > preview_length:
+        preview = preview[:preview_length] + "..."
+    digest['preview'] = preview
+
+    return digest
+
+def format_tool_digest(tool_call: Dict[str, Any]) -> str:
+    """Render a tool call digest as a single line of prompt context"""
+    target = tool_call.get('query') or tool_call.get('arguments', '')
+    line = f"{tool_call['tool']}({target})"
+
+    if tool_call.get('error'):
+        return f"{line} -> error: {tool_call['error']}"
+    if 'row_count' in tool_call:
+        line += f" -> {tool_call['row_count']} rows, columns {tool_call.get('columns', [])}"
+    return f"{line}, preview: {tool_call.get('preview', '')}"
 
 class AgentMemory:
     def __init__(self, config: Optional[MemoryConfig] = None):
         self.config = config or MemoryConfig()
         self.session_id = str(uuid.uuid4())
+        # Usage of summary calls not yet attributed to a turn
+        self.pending_usage = empty_usage()
         self.setup_database()
 
     def setup_database(self):
@@ -35,9 +101,23 @@ class AgentMemory:
                 user_input TEXT NOT NULL,
                 agent_response TEXT NOT NULL,
                 tool_calls JSONB,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                total_tokens INTEGER NOT NULL DEFAULT 0,
+                llm_calls INTEGER NOT NULL DEFAULT 0,
                 timestamp TIMESTAMPTZ DEFAULT NOW()
             );
             """,
+            # Add usage columns to tables created before token metering existed
+            """
+            ALTER TABLE conversations
+                ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS completion_tokens INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS cached_tokens INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS total_tokens INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS llm_calls INTEGER NOT NULL DEFAULT 0;
+            """,
             """
             CREATE TABLE IF NOT EXISTS conversation_summaries (
                 id SERIAL PRIMARY KEY,
@@ -47,6 +127,15 @@ class AgentMemory:
                 end_time TIMESTAMPTZ NOT NULL,
                 message_count INTEGER NOT NULL
             );
+            """,
+            # Full tool results, content-addressed so repeats are stored once
+            """
+            CREATE TABLE IF NOT EXISTS tool_results (
+                result_hash CHAR(64) PRIMARY KEY,
+                tool TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW()
+            );
             """
         ]
 
@@ -58,23 +147,84 @@ class AgentMemory:
     def store_interaction(self,
                          user_input: str,
                          agent_response: str,
-                         tool_calls: Optional[List[Dict]] = None):
-        """Store a single interaction in the database"""
+                         tool_calls: Optional[List[Dict]] = None,
+                         usage: Optional[Dict[str, int]] = None,
+                         tool_results: Optional[Dict[str, Dict]] = None):
+        """
+        Store a single interaction and its token usage in the database.
+
+        `tool_calls` holds compact digests only; the full results they point
+        to are passed in `tool_results`, keyed by result hash.
+        """
         query = """
         INSERT INTO conversations
-            (session_id, user_input, agent_response, tool_calls)
-        VALUES (%s, %s, %s, %s)
+            (session_id, user_input, agent_response, tool_calls,
+             prompt_tokens, completion_tokens, cached_tokens, total_tokens, llm_calls)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        tool_result_query = """
+        INSERT INTO tool_results (result_hash, tool, result)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (result_hash) DO NOTHING
         """
+        usage = usage or empty_usage()
 
         with psycopg2.connect(self.config.db_connection) as conn:
             with conn.cursor() as cur:
+                for result_hash, tool_result in (tool_results or {}).items():
+                    cur.execute(tool_result_query, (
+                        result_hash,
+                        tool_result['tool'],
+                        tool_result['result']
+                    ))
+
                 cur.execute(query, (
                     self.session_id,
                     user_input,
                     agent_response,
-                    Json(tool_calls) if tool_calls else None
+                    Json(tool_calls) if tool_calls else None,
+                    usage["prompt_tokens"],
+                    usage["completion_tokens"],
+                    usage["cached_tokens"],
+                    usage["total_tokens"],
+                    usage["llm_calls"]
                 ))
 
+    def load_tool_result(self, result_hash: str) -> Optional[str]:
+        """Load the full result of a tool call by the hash stored in its digest"""
+        query = """
+        SELECT result
+        FROM tool_results
+        WHERE result_hash = %s
+        """
+
+        with psycopg2.connect(self.config.db_connection) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (result_hash,))
+                row = cur.fetchone()
+
+        return row[0] if row else None
+
+    def get_session_usage(self) -> Dict[str, int]:
+        """Get the token usage aggregated over all stored turns of this session"""
+        query = """
+        SELECT
+            COALESCE(SUM(prompt_tokens), 0),
+            COALESCE(SUM(completion_tokens), 0),
+            COALESCE(SUM(cached_tokens), 0),
+            COALESCE(SUM(total_tokens), 0),
+            COALESCE(SUM(llm_calls), 0)
+        FROM conversations
+        WHERE session_id = %s
+        """
+
+        with psycopg2.connect(self.config.db_connection) as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (self.session_id,))
+                row = cur.fetchone()
+
+        return dict(zip(empty_usage().keys(), (int(value) for value in row)))
+
     def create_summary(self, messages: List[Dict]) -> str:
         """Create a summary of messages using the LLM"""
         # client = OpenAI()
@@ -98,6 +248,7 @@ class AgentMemory:
             model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
             messages=[{"role": "user", "content": summary_prompt}]
         )
+        add_usage(self.pending_usage, response.usage)
 
         return response.choices[0].message.content
 
@@ -170,7 +321,18 @@ class AgentMemory:
             user_input, agent_response, tool_calls, _ = conv
             context.append(f"User: {user_input}")
             if tool_calls:
-                context.append(f"Tool Usage: {tool_calls}")
+                digests = []
+                for tool_call in tool_calls:
+                    # Rows stored before digests existed still hold the full result
+                    if 'result' in tool_call:
+                        tool_call = digest_tool_call(
+                            tool_call['tool'],
+                            tool_call.get('arguments', ''),
+                            tool_call['result'],
+                            self.config.tool_preview_length
+                        )
+                    digests.append(format_tool_digest(tool_call))
+                context.append(f"Tool Usage: {'; '.join(digests)}")
             context.append(f"Assistant: {agent_response}")
 
         return "\n".join(context)
@@ -216,7 +378,9 @@ class AgentMemory:
 
 # Update Agent class to use memory.
 class MemoryAgent(Agent):
-    def __init__(self, memory_config: Optional[MemoryConfig] = None):
+    def __init__(self,
+                 memory_config: Optional[MemoryConfig] = None,
+                 token_budget: Optional[TokenBudget] = None):
         # self.client = OpenAI()
         self.client = AzureOpenAI(
             api_key=os.getenv("AZURE_OPENAI_KEY"),
@@ -226,13 +390,34 @@ class MemoryAgent(Agent):
         self.memory = AgentMemory(memory_config)
         self.messages = []
 
+        # Token usage of the current turn and of the whole session
+        self.token_budget = token_budget or TokenBudget()
+        self.turn_usage = empty_usage()
+        self.session_usage = empty_usage()
+
+        # Tool calls of the current turn: digests and full results by hash
+        self.last_tool_calls = []
+        self.last_tool_results = {}
+
         # Initialize with system prompt
         self.messages.append({
             "role": "system",
             "content": "You are a helpful AI assistant..."
         })
 
+    def start_turn(self):
+        super().start_turn()
+        self.last_tool_calls = []
+        self.last_tool_results = {}
+
+        # Attribute summary calls made while preparing this turn to it
+        self.record_usage(self.memory.pending_usage)
+        self.memory.pending_usage = empty_usage()
+
     def process_query(self, user_input: str) -> str:
+        # Clear the previous turn's usage in case we fail before the query runs
+        self.start_turn()
+
         try:
             # Check if we need to summarize before adding new messages
             self.memory.check_and_summarize()
@@ -254,14 +439,12 @@ class MemoryAgent(Agent):
             response = super().process_query(user_input)
 
             # Store the interaction in memory
-            tool_calls = None
-            if hasattr(self, 'last_tool_calls'):
-                tool_calls = self.last_tool_calls
-
             self.memory.store_interaction(
                 user_input=user_input,
                 agent_response=response,
-                tool_calls=tool_calls
+                tool_calls=self.last_tool_calls or None,
+                usage=self.turn_usage,
+                tool_results=self.last_tool_results
             )
 
             return response
@@ -270,22 +453,25 @@ class MemoryAgent(Agent):
             error_message = f"Error processing query: {str(e)}"
             self.memory.store_interaction(
                 user_input=user_input,
-                agent_response=error_message
+                agent_response=error_message,
+                usage=self.turn_usage
             )
             return error_message
 
     def execute_tool(self, tool_call: Any) -> str:
-        # Store tool calls for memory
-        if not hasattr(self, 'last_tool_calls'):
-            self.last_tool_calls = []
-
         result = super().execute_tool(tool_call)
 
-        # Store tool call information
-        self.last_tool_calls.append({
+        # Keep a compact digest inline and the full result by its hash
+        digest = digest_tool_call(
+            tool_call.function.name,
+            tool_call.function.arguments,
+            result,
+            self.memory.config.tool_preview_length
+        )
+        self.last_tool_calls.append(digest)
+        self.last_tool_results[digest['result_hash']] = {
             'tool': tool_call.function.name,
-            'arguments': tool_call.function.arguments,
             'result': result
-        })
+        }
 
         return result
\ No newline at end of file